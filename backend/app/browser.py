@@ -1,102 +1,206 @@
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
 import asyncio
-import json
+import logging
 import os
 import re
-import sys
 import platform
+import orjson
 from typing import Dict, List, Optional, Callable, Any
 import random
 import string
 
+logger = logging.getLogger("browser")
+logger.setLevel(logging.INFO)
+
 MAX_RETRIES = 3
 RETRY_DELAY = 1.0
 
-if platform.system() == 'Windows' and sys.version_info >= (3, 8):
+# Extraction only reads DOM text and hrefs. Stylesheets are kept because
+# wait/click checks rely on CSS-driven visibility.
+_BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+
+# Static events, serialized once; send_event forwards bytes as-is
+_EVT_READY = orjson.dumps({"type": "status", "message": "Browser initialized", "status": "ready"})
+_EVT_COMPLETED = orjson.dumps({"type": "status", "message": "Task completed", "status": "completed"})
+
+# Strips separators, currency symbols and whitespace from price strings in one pass;
+# shared with the result validator in main.py so both read prices the same way
+PRICE_TABLE = str.maketrans("", "", ",₹$ \t")
+
+if platform.system() == 'Windows':
+    # Playwright starts its node driver with asyncio subprocesses, which only the Proactor loop supports
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+
+
+_PW = None
+_BROWSER = None
+_BROWSER_LOCK = asyncio.Lock()
+
+
+async def _ensure_playwright():
+    """Start the Playwright driver if needed; caller must hold _BROWSER_LOCK"""
+    global _PW
+    if _PW is None:
+        _PW = await async_playwright().start()
+    return _PW
+
+
+async def _get_browser():
+    """
+    Return the shared Chromium instance, launching it on first use.
+    If BROWSER_CDP_URL is set, connect to that running browser instead.
+    Every run gets its own context on this browser, so the expensive
+    launch is paid once per process instead of once per request.
+    """
+    global _BROWSER
+    async with _BROWSER_LOCK:
+        if _BROWSER is not None and _BROWSER.is_connected():
+            return _BROWSER
+        p = await _ensure_playwright()
+        # Prefer a shared Chromium exposed over CDP (see start_browser.py)
+        cdp_url = os.getenv("BROWSER_CDP_URL")
+        if cdp_url:
+            _BROWSER = await p.chromium.connect_over_cdp(cdp_url)
+            return _BROWSER
+        headless = _headless()
+        _BROWSER = await p.chromium.launch(
+            headless=headless,
+            args=["--disable-blink-features=AutomationControlled"] if not headless else []
+        )
+        return _BROWSER
+
+
+def _headless() -> bool:
+    # Use environment variable or default to headed mode
+    return os.getenv("BROWSER_HEADLESS", "false").lower() == "true"
+
+
+async def start_browser():
+    """
+    Start Playwright on app startup and, when connecting over CDP or running headless,
+    the shared browser too. A local headed Chromium is still launched on first use,
+    so several workers do not each open a window before any request arrives.
+    Returns the browser, or None if it was left for later.
+    """
+    if os.getenv("BROWSER_CDP_URL") or _headless():
+        return await _get_browser()
+    async with _BROWSER_LOCK:
+        await _ensure_playwright()
+    return None
+
+
+async def warm_browser():
+    """Launch or connect the shared browser ahead of a run; errors surface in run_action_plan"""
     try:
-        if not isinstance(asyncio.get_event_loop_policy(), asyncio.WindowsProactorEventLoopPolicy):
-            asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-    except:
-        pass
+        await _get_browser()
+    except Exception as e:
+        logger.warning("Browser warm-up failed: %s", e)
 
 
-async def run_action_plan(plan: list, send_event: Callable) -> list:
+async def close_browser():
+    """
+    Close the shared browser and stop Playwright (called on app shutdown).
+    For a CDP browser this only disconnects; the remote process keeps running.
+    """
+    global _PW, _BROWSER
+    async with _BROWSER_LOCK:
+        if _BROWSER is not None:
+            try:
+                await _BROWSER.close()
+            except Exception as e:
+                logger.warning("Error closing browser: %s", e)
+            _BROWSER = None
+        if _PW is not None:
+            await _PW.stop()
+            _PW = None
+
+
+async def run_action_plan(plan: list, send_event: Callable, browser=None) -> list:
     """
     Execute browser actions based on plan with robust error handling and retries.
     send_event is an async callback to send live events (to websocket).
+    browser is the instance launched at startup; if missing or disconnected the shared one is (re)launched.
+    Each run gets a fresh context on the shared browser.
     Returns extracted results from the page (if any).
     """
     results = []
     page = None
-    browser = None
+    context = None
     
     try:
-        async with async_playwright() as p:
-            # Use environment variable or default to headless mode
-            headless = os.getenv("BROWSER_HEADLESS", "false").lower() == "true"
+        try:
+            if browser is None or not browser.is_connected():
+                browser = await _get_browser()
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            await send_event({
+                "type": "error",
+                "message": f"Failed to launch browser: {str(e)}. Install browsers: playwright install chromium"
+            })
+            return []
+        
+        context = await browser.new_context(
+            viewport={"width": 1920, "height": 1080},
+            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+        )
+        await context.add_init_script(_EXTRACTOR_JS)
+        if os.getenv("BROWSER_BLOCK_ASSETS", "true").lower() == "true":
+            await context.route("**/*", _block_assets)
+        page = await context.new_page()
+        
+        await send_event(_EVT_READY)
+        
+        # Bounds from a filter_price step, applied in-page by the next extract_products step
+        price_bounds = {}
+        
+        for step_idx, step in enumerate(plan):
+            action = step.get("action")
+            await send_event({
+                "type": "action_start",
+                "action": action,
+                "step": step_idx + 1,
+                "total_steps": len(plan)
+            })
             
             try:
-                browser = await p.chromium.launch(
-                    headless=headless,
-                    args=["--disable-blink-features=AutomationControlled"] if not headless else []
-                )
-            except Exception as e:
-                await send_event({
-                    "type": "error",
-                    "message": f"Failed to launch browser: {str(e)}. Install browsers: playwright install chromium"
-                })
-                return []
-            
-            context = await browser.new_context(
-                viewport={"width": 1920, "height": 1080},
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            )
-            page = await context.new_page()
-            
-            await send_event({"type": "status", "message": "Browser initialized", "status": "ready"})
-            
-            for step_idx, step in enumerate(plan):
-                action = step.get("action")
-                await send_event({
-                    "type": "action_start",
-                    "action": action,
-                    "step": step_idx + 1,
-                    "total_steps": len(plan)
-                })
-                
-                try:
-                    if action == "navigate":
-                        await _handle_navigate(page, step, send_event)
-                    elif action == "wait_for":
-                        await _handle_wait_for(page, step, send_event)
-                    elif action == "type":
-                        await _handle_type(page, step, send_event)
-                    elif action == "click":
-                        await _handle_click(page, step, send_event)
-                    elif action == "filter_price":
-                        await _handle_filter_price(page, step, send_event)
-                    elif action == "filter_rating":
-                        await _handle_filter_rating(page, step, send_event)
-                    elif action == "extract_products":
-                        extracted = await _handle_extract_products(page, step, send_event)
-                        results.extend(extracted)
-                    elif action == "fill_form_field":
-                        await _handle_fill_form_field(page, step, send_event)
-                    elif action == "submit_form":
-                        await _handle_submit_form(page, step, send_event)
-                    elif action == "unsupported":
-                        await send_event({"type": "error", "message": step.get("reason", "Unsupported action")})
-                        break
-                    else:
-                        await send_event({"type": "error", "message": f"Unknown action: {action}"})
-                    
-                except Exception as e:
-                    await send_event({"type": "error", "message": f"Error in {action}: {str(e)}"})
-                    continue
+                if action == "navigate":
+                    await _handle_navigate(page, step, send_event)
+                elif action == "wait_for":
+                    await _handle_wait_for(page, step, send_event)
+                elif action == "type":
+                    await _handle_type(page, step, send_event)
+                elif action == "click":
+                    await _handle_click(page, step, send_event)
+                elif action == "filter_price":
+                    price_bounds = {k: step[k] for k in ("max_price", "min_price") if step.get(k) is not None}
+                    await _handle_filter_price(page, step, send_event)
+                elif action == "filter_rating":
+                    await _handle_filter_rating(page, step, send_event)
+                elif action == "extract_products":
+                    if price_bounds:
+                        # Bounds set on the extract step itself take precedence
+                        step = {**price_bounds, **step}
+                        price_bounds = {}
+                    extracted = await _handle_extract_products(page, step, send_event)
+                    results.extend(extracted)
+                elif action == "fill_form_field":
+                    await _handle_fill_form_field(page, step, send_event)
+                elif action == "submit_form":
+                    await _handle_submit_form(page, step, send_event)
+                elif action == "unsupported":
+                    await send_event({"type": "error", "message": step.get("reason", "Unsupported action")})
+                    break
+                else:
+                    await send_event({"type": "error", "message": f"Unknown action: {action}"})
                 
-                await send_event({"type": "action_complete", "action": action})
+            except Exception as e:
+                await send_event({"type": "error", "message": f"Error in {action}: {str(e)}"})
+                continue
             
-            await send_event({"type": "status", "message": "Task completed", "status": "completed"})
+            await send_event({"type": "action_complete", "action": action})
+        
+        await send_event(_EVT_COMPLETED)
             
     except NotImplementedError as e:
         msg = f"Playwright subprocess error. Use 'python start_server.py' (not uvicorn directly)."
@@ -107,23 +211,52 @@ async def run_action_plan(plan: list, send_event: Callable) -> list:
             msg += " Try: python start_server.py"
         await send_event({"type": "error", "message": msg, "status": "failed"})
     finally:
-        if page:
+        # Optionally keep the final page up briefly, e.g. for screenshots while debugging
+        if page and os.getenv("BROWSER_DEBUG_HOLD"):
             await asyncio.sleep(1)
-        if browser:
-            await browser.close()
+        # Only the per-run context is closed; the shared browser stays warm
+        if context:
+            try:
+                await context.close()
+            except Exception as e:
+                logger.warning("Error closing browser context: %s", e)
 
     return results
 
 
+async def _block_assets(route):
+    """Abort requests for assets the extractor never looks at"""
+    if route.request.resource_type in _BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
 async def _find_selector_with_retry(page, selectors: str, timeout: int = 10000) -> Optional[Any]:
-    """Try multiple selectors with retries"""
+    """
+    Wait for any visible match of the comma-separated selectors as a single union query.
+    visible=true filters before the first match is taken, so a hidden element earlier
+    in the DOM cannot mask a visible one. If the union is rejected (e.g. one alternative
+    does not parse), the selectors are tried one by one with retries in the same budget.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout / 1000
+    try:
+        return await page.wait_for_selector(f"{selectors} >> visible=true", timeout=timeout)
+    except PlaywrightTimeoutError:
+        return None
+    except PlaywrightError:
+        pass
     for selector in [s.strip() for s in selectors.split(",")]:
         for attempt in range(MAX_RETRIES):
+            remaining = int((deadline - loop.time()) * 1000)
+            if remaining <= 0:
+                return None
             try:
-                return await page.wait_for_selector(selector, timeout=timeout, state="visible")
-            except:
+                return await page.wait_for_selector(f"{selector} >> visible=true", timeout=remaining)
+            except PlaywrightError:
                 if attempt < MAX_RETRIES - 1:
-                    await asyncio.sleep(RETRY_DELAY * (attempt + 1))
+                    await asyncio.sleep(min(RETRY_DELAY * (attempt + 1), remaining / 1000))
     return None
 
 
@@ -132,7 +265,13 @@ async def _handle_navigate(page, step: dict, send_event: Callable):
     url = step.get("url")
     await send_event({"type": "action", "action": "navigate", "target": url, "message": f"Navigating to {url}"})
     try:
-        await page.goto(url, wait_until=step.get("wait_until", "networkidle"), timeout=30000)
+        await page.goto(url, wait_until=step.get("wait_until", "domcontentloaded"), timeout=30000)
+        ready_selector = step.get("ready_selector")
+        if ready_selector:
+            try:
+                await page.wait_for_selector(f"{ready_selector} >> visible=true", timeout=10000)
+            except PlaywrightTimeoutError:
+                await send_event({"type": "warning", "message": f"Page not ready: {ready_selector[:50]}, continuing..."})
         title = await page.title()
         await send_event({"type": "action", "action": "navigate", "message": f"✓ Loaded: {title[:50]}"})
     except PlaywrightTimeoutError:
@@ -157,41 +296,55 @@ async def _handle_type(page, step: dict, send_event: Callable):
         await page.fill(selector, "")
     try:
         await page.click(selector, timeout=2000)
-    except:
+    except PlaywrightError:
         pass
-    await page.type(selector, value, delay=50)
+    # fill sets the value with a single input event; per-key typing only when asked for
+    if step.get("keystroke"):
+        await page.type(selector, value, delay=0)
+    else:
+        await page.fill(selector, value)
+    if step.get("submit"):
+        await page.keyboard.press("Enter")
     await send_event({"type": "action", "action": "type", "message": f"Typed: '{value[:30]}...'"})
 
 
+async def _first_matching_locator(page, selector: str, timeout: int = 5000):
+    """
+    Locator for the first alternative of a comma-separated selector that is visible.
+    Waits once on the union, then picks in list order (a plain union would pick DOM order).
+    Hidden matches, e.g. a duplicate mobile search box, are skipped.
+    """
+    await page.locator(f"{selector} >> visible=true").first.wait_for(state="visible", timeout=timeout)
+    for sel in [s.strip() for s in selector.split(",")]:
+        loc = page.locator(f"{sel} >> visible=true").first
+        if await loc.count():
+            return loc
+    return page.locator(f"{selector} >> visible=true").first
+
+
 async def _handle_click(page, step: dict, send_event: Callable):
     """Handle click action"""
     selector = step.get("selector", "")
-    selectors = [s.strip() for s in selector.split(",")]
-    clicked = False
-    for sel in selectors:
-        try:
-            await page.click(sel, timeout=5000)
-            clicked = True
-            break
-        except:
-            continue
-    if not clicked:
+    try:
+        loc = await _first_matching_locator(page, selector)
+        await loc.click(timeout=5000)
+        await send_event({"type": "action", "action": "click", "message": "Clicked"})
+    except PlaywrightError:
         await page.keyboard.press("Enter")
         await send_event({"type": "action", "action": "click", "message": "Pressed Enter"})
-    else:
-        await send_event({"type": "action", "action": "click", "message": "Clicked"})
-    if step.get("wait_after"):
-        await page.wait_for_load_state(step["wait_after"], timeout=15000)
-        await asyncio.sleep(1)
+    # Only wait when the plan asks for it; the next step waits on its own selector
+    wait_after = step.get("wait_after")
+    if wait_after:
+        await page.wait_for_load_state(wait_after, timeout=15000)
 
 
 async def _handle_filter_price(page, step: dict, send_event: Callable):
-    """Handle price filtering - tries UI first, falls back to post-extraction"""
+    """Handle price filtering - tries UI first; the run loop passes the bounds on to extraction"""
     max_p, min_p = step.get("max_price"), step.get("min_price")
     await send_event({"type": "action", "action": "filter_price", 
                      "message": f"Filtering: ₹{min_p or 0}-{max_p or '∞'}"})
     try:
-        await asyncio.sleep(1)
+        await page.wait_for_load_state("domcontentloaded", timeout=5000)
         # Try UI filter inputs
         for sel in ["input[placeholder*='Max']", "input._2IX2F-:last-of-type"]:
             try:
@@ -199,13 +352,11 @@ async def _handle_filter_price(page, step: dict, send_event: Callable):
                     await page.fill(sel.split(",")[0], str(max_p), timeout=3000)
                     await page.keyboard.press("Enter")
                 break
-            except:
+            except PlaywrightError:
                 continue
         await page.wait_for_load_state("networkidle", timeout=10000)
-        await asyncio.sleep(2)
-    except:
+    except PlaywrightError:
         pass
-    step["max_price"], step["min_price"] = max_p, min_p
 
 
 async def _handle_filter_rating(page, step: dict, send_event: Callable):
@@ -217,328 +368,391 @@ async def _handle_filter_rating(page, step: dict, send_event: Callable):
             await page.click(sel, timeout=3000)
             await page.wait_for_load_state("networkidle", timeout=10000)
             return
-        except:
+        except PlaywrightError:
             continue
 
 
-async def _handle_extract_products(page, step: dict, send_event: Callable) -> List[Dict]:
-    """Extract product/item information - supports Flipkart and Zomato"""
-    product_selector = step.get("product_selector", "")
-    fields = step.get("fields", {})
-    count = step.get("count", 3)
-    site = step.get("site", "flipkart")
-    
-    await send_event({"type": "action", "action": "extract_products", "message": f"Extracting top {count} results..."})
-    
-    try:
-        await page.wait_for_selector("div[data-id], [class*='restaurant'], [class*='jumbo-tracker']", timeout=20000)
-        await asyncio.sleep(2)
-    except:
-        pass
-    await asyncio.sleep(2)
-    
-    # Site-specific extraction
-    if site == "zomato":
-        extraction_script = """
-    (() => {
-        const products = [];
-        // Try multiple selectors for restaurant cards
-        const selectors = [
-            '[data-testid*="restaurant"]',
-            '[class*="jumbo-tracker"]',
-            '[class*="sc-1mo3ldo"]',
-            '[class*="restaurant-card"]',
-            'div[class*="card"]'
-        ];
-        
-        let containers = [];
-        for (const sel of selectors) {
-            try {
-                const els = document.querySelectorAll(sel);
-                if (els.length > 0) {
-                    containers = Array.from(els).slice(0, 20);
-                    break;
+# Installed once per context with add_init_script; handlers then only invoke it
+_EXTRACTOR_JS = """
+(() => {
+    // Shared regexes, compiled once per document
+    const RE_NUM = /([\\d.]+)/;
+    const RE_COST = /₹?([\\d,]+)/;
+    const RE_PRICE = /₹\\s*([\\d,]+)|Rs\\.?\\s*([\\d,]+)/;
+    const RE_RATING_TEXT = /\\d\\.\\d|\\d\\s+★/;
+    const RE_PRODUCT_HREF = /\\/p\\//;
+    const RE_RESTAURANT_HREF = /\\/r\\//;
+    const RE_COMMAS = /,/g;
+    const RE_NON_DIGITS = /[^\\d]/g;
+    const RE_SPACES = /\\s+/g;
+
+    // Card container selector that matched on the last call for each site, tried first
+    // next time. Field selectors keep their fixed priority order on every card.
+    window.__winningSel = window.__winningSel || {};
+
+    window.__extractProducts = function(opts) {
+        const winners = window.__winningSel[opts.site] = window.__winningSel[opts.site] || {};
+        const qsaCache = new Map();
+        const qCache = new WeakMap();
+
+        // document.querySelectorAll memoized per selector for this call
+        function qsa(sel) {
+            let els = qsaCache.get(sel);
+            if (els === undefined) {
+                try {
+                    els = Array.from(document.querySelectorAll(sel));
+                } catch(e) {
+                    els = [];
                 }
-            } catch(e) { continue; }
+                qsaCache.set(sel, els);
+            }
+            return els;
         }
-        
-        // Fallback: find any div with restaurant-like content
-        if (containers.length === 0) {
-            const allDivs = Array.from(document.querySelectorAll('div'));
-            for (const div of allDivs) {
-                const hasRestaurantLink = div.querySelector('a[href*="/r/"]');
-                const hasRating = div.textContent.match(/\\d\\.\\d|\\d\\s+★/);
-                if (hasRestaurantLink && hasRating) {
-                    containers.push(div);
-                    if (containers.length >= 20) break;
+
+        // container.querySelector memoized per (container, selector)
+        function q(container, sel) {
+            let cache = qCache.get(container);
+            if (!cache) {
+                cache = new Map();
+                qCache.set(container, cache);
+            }
+            if (!cache.has(sel)) {
+                let el = null;
+                try { el = container.querySelector(sel); } catch(e) {}
+                cache.set(sel, el);
+            }
+            return cache.get(sel);
+        }
+
+        function findContainers(selectors) {
+            const win = winners.container;
+            const candidates = win ? [win].concat(selectors.filter(s => s !== win)) : selectors;
+            for (const sel of candidates) {
+                const els = qsa(sel);
+                if (els.length > 0) {
+                    winners.container = sel;
+                    return els.slice(0, 20);
                 }
             }
+            return [];
+        }
+
+        // Fallback when no known card selector matches: one TreeWalker pass over
+        // links whose href matches hrefRe, climbing from each to the nearest
+        // ancestor whose text matches textRe
+        function findContainersByLink(hrefRe, textRe) {
+            const containers = [];
+            if (!document.body) return containers;
+            const tw = document.createTreeWalker(document.body, NodeFilter.SHOW_ELEMENT, {
+                acceptNode: n => (n.tagName === 'A' && hrefRe.test(n.getAttribute('href') || ''))
+                    ? NodeFilter.FILTER_ACCEPT : NodeFilter.FILTER_SKIP
+            });
+            while (containers.length < 20 && tw.nextNode()) {
+                let c = tw.currentNode;
+                while (c && c !== document.body && !textRe.test(c.textContent || '')) c = c.parentElement;
+                if (c && c !== document.body && !containers.includes(c)) containers.push(c);
+            }
+            return containers;
         }
+
+        // Stop after twice the requested count, leaving slack for Python-side checks
+        const limit = Math.max(1, (opts.count || 3) * 2);
+
+        // Rating/price bounds applied before results cross CDP (null = no bound)
+        function passesFilters(item) {
+            if (opts.min_rating != null && (parseFloat(item.rating) || 0) < opts.min_rating) return false;
+            if (opts.min_price != null && item.price < opts.min_price) return false;
+            if (opts.max_price != null && item.price > opts.max_price) return false;
+            return true;
+        }
+
+        function extractRestaurants() {
+            const products = [];
+            // Try multiple selectors for restaurant cards
+            let containers = findContainers([
+                '[data-testid*="restaurant"]',
+                '[class*="jumbo-tracker"]',
+                '[class*="sc-1mo3ldo"]',
+                '[class*="restaurant-card"]',
+                'div[class*="card"]'
+            ]);
         
-        containers.forEach(container => {
-            const item = {};
+            // Fallback: nearest ancestor of a restaurant link with rating-like text
+            if (containers.length === 0) {
+                containers = findContainersByLink(RE_RESTAURANT_HREF, RE_RATING_TEXT);
+            }
+        
+            for (const container of containers) {
+                const item = {};
             
-            // Extract name - multiple strategies
-            const nameSelectors = ['h4', 'a[href*="/r/"]', '[class*="restaurant-name"]', 'a'];
-            for (const sel of nameSelectors) {
-                const nameEl = container.querySelector(sel);
-                if (nameEl) {
-                    item.name = (nameEl.textContent || nameEl.getAttribute('title') || '').trim();
-                    if (item.name && item.name.length >= 3) break;
+                // Extract name - multiple strategies
+                const nameSelectors = ['h4', 'a[href*="/r/"]', '[class*="restaurant-name"]', 'a'];
+                for (const sel of nameSelectors) {
+                    const nameEl = q(container, sel);
+                    if (nameEl) {
+                        item.name = (nameEl.textContent || nameEl.getAttribute('title') || '').trim();
+                        if (item.name && item.name.length >= 3) {
+                            break;
+                        }
+                    }
                 }
-            }
             
-            // Extract rating
-            const ratingSelectors = ['[class*="rating"]', '[class*="sc-1q7bklc"]', '.rating'];
-            for (const sel of ratingSelectors) {
-                const ratingEl = container.querySelector(sel);
-                if (ratingEl) {
-                    const ratingText = ratingEl.textContent || '';
-                    const match = ratingText.match(/([\\d.]+)/);
-                    if (match && parseFloat(match[1]) >= 1 && parseFloat(match[1]) <= 5) {
-                        item.rating = match[1];
-                        break;
+                // Extract rating
+                const ratingSelectors = ['[class*="rating"]', '[class*="sc-1q7bklc"]', '.rating'];
+                for (const sel of ratingSelectors) {
+                    const ratingEl = q(container, sel);
+                    if (ratingEl) {
+                        const ratingText = ratingEl.textContent || '';
+                        const match = RE_NUM.exec(ratingText);
+                        if (match && parseFloat(match[1]) >= 1 && parseFloat(match[1]) <= 5) {
+                            item.rating = match[1];
+                            break;
+                        }
                     }
                 }
-            }
             
-            // Extract cost for two (optional)
-            const costSelectors = ['[class*="cost"]', '[class*="sc-1hez2tp"]', '[class*="price-range"]'];
-            for (const sel of costSelectors) {
-                const costEl = container.querySelector(sel);
-                if (costEl) {
-                    const costText = costEl.textContent || '';
-                    const costMatch = costText.match(/₹?([\\d,]+)/);
-                    if (costMatch) {
-                        item.price = costMatch[1].replace(/,/g, '');
-                        break;
+                // Extract cost for two (optional)
+                const costSelectors = ['[class*="cost"]', '[class*="sc-1hez2tp"]', '[class*="price-range"]'];
+                for (const sel of costSelectors) {
+                    const costEl = q(container, sel);
+                    if (costEl) {
+                        const costText = costEl.textContent || '';
+                        const costMatch = RE_COST.exec(costText);
+                        if (costMatch) {
+                            item.price = parseInt(costMatch[1].replace(RE_COMMAS, ''), 10) || 0;
+                            break;
+                        }
                     }
                 }
-            }
             
-            // Extract URL
-            const link = container.querySelector('a[href*="/r/"]');
-            if (link) {
-                item.url = link.href || link.getAttribute('href') || '';
-                if (item.url && !item.url.startsWith('http')) {
-                    item.url = window.location.origin + item.url;
+                // Extract URL
+                const link = q(container, 'a[href*="/r/"]');
+                if (link) {
+                    item.url = link.href || link.getAttribute('href') || '';
+                    if (item.url && !item.url.startsWith('http')) {
+                        item.url = window.location.origin + item.url;
+                    }
                 }
-            }
             
-            // For restaurants: name is required, rating preferred, price optional
-            if (item.name && item.name.length >= 3) {
-                item.rating = item.rating || '';
-                item.price = item.price || '';
-                item.url = item.url || '';
-                products.push(item);
-            }
-        });
-        
-        return products;
-    })()
-    """
-    else:
-        # Flipkart/product extraction
-        extraction_script = """
-    (() => {
-        const products = [];
-        
-        // Flipkart product containers - multiple strategies
-        const containerSelectors = [
-            'div[data-id]',
-            'div._1AtVbE',
-            'div._2kHMtA',
-            'div[class*="_13oc-S"]',
-            'div[class*="tUxRFH"]',
-            '[data-id]'
-        ];
-        
-        let productContainers = [];
-        
-        for (const sel of containerSelectors) {
-            try {
-                const elements = document.querySelectorAll(sel);
-                if (elements.length > 0) {
-                    productContainers = Array.from(elements).slice(0, 20); // Get more for filtering
-                    console.log('Found ' + elements.length + ' containers with: ' + sel);
-                    break;
+                // For restaurants: name is required, rating preferred, price optional
+                if (item.name && item.name.length >= 3) {
+                    item.rating = item.rating || '';
+                    item.price = item.price || 0;
+                    item.url = item.url || '';
+                    if (passesFilters(item)) products.push(item);
                 }
-            } catch(e) {
-                continue;
+                if (products.length >= limit) break;
             }
+        
+            return products;
         }
+
+        function extractProductCards() {
+            const products = [];
         
-        // If still no containers, try finding any div with product-like structure
-        if (productContainers.length === 0) {
-            const allDivs = document.querySelectorAll('div');
-            for (const div of allDivs) {
-                const hasLink = div.querySelector('a[href*="/p/"]');
-                const hasPrice = div.textContent.match(/₹[\\d,]+|Rs\\.?[\\d,]+/);
-                if (hasLink && hasPrice && !div.querySelector('div[data-id]')) {
-                    productContainers.push(div);
-                    if (productContainers.length >= 20) break;
-                }
+            // Flipkart product containers - multiple strategies
+            let productContainers = findContainers([
+                'div[data-id]',
+                'div._1AtVbE',
+                'div._2kHMtA',
+                'div[class*="_13oc-S"]',
+                'div[class*="tUxRFH"]',
+                '[data-id]'
+            ]);
+        
+            // If still no containers, climb from product links to an ancestor with a price
+            if (productContainers.length === 0) {
+                productContainers = findContainersByLink(RE_PRODUCT_HREF, RE_PRICE);
             }
-        }
         
-        productContainers.forEach((container, idx) => {
-            const item = {};
+            for (const container of productContainers) {
+                const item = {};
             
-            // Extract URL - most reliable
-            const links = container.querySelectorAll('a[href*="/p/"]');
-            if (links.length > 0) {
-                const link = links[0];
-                item.url = link.href || link.getAttribute('href') || '';
-                if (item.url && !item.url.startsWith('http')) {
-                    item.url = window.location.origin + item.url;
+                // Extract URL - most reliable
+                const link = q(container, 'a[href*="/p/"]');
+                if (link) {
+                    item.url = link.href || link.getAttribute('href') || '';
+                    if (item.url && !item.url.startsWith('http')) {
+                        item.url = window.location.origin + item.url;
+                    }
+                    // Extract name from link
+                    item.name = link.getAttribute('title') || link.textContent.trim() || '';
                 }
-                // Extract name from link
-                item.name = link.getAttribute('title') || link.textContent.trim() || '';
-            }
             
-            // Try alternative name extraction
-            if (!item.name || item.name.length < 3) {
-                const nameSelectors = [
-                    'a[title]',
-                    '._4rR01T',
-                    'a._2UzuFa',
-                    'a.s1Q9rs',
-                    'a._1fQZEK'
-                ];
-                for (const sel of nameSelectors) {
-                    const elem = container.querySelector(sel);
-                    if (elem) {
-                        item.name = elem.getAttribute('title') || elem.textContent.trim() || '';
-                        if (item.name && item.name.length >= 3) break;
+                // Try alternative name extraction
+                if (!item.name || item.name.length < 3) {
+                    const nameSelectors = [
+                        'a[title]',
+                        '._4rR01T',
+                        'a._2UzuFa',
+                        'a.s1Q9rs',
+                        'a._1fQZEK'
+                    ];
+                    for (const sel of nameSelectors) {
+                        const elem = q(container, sel);
+                        if (elem) {
+                            item.name = elem.getAttribute('title') || elem.textContent.trim() || '';
+                            if (item.name && item.name.length >= 3) {
+                                break;
+                            }
+                        }
                     }
                 }
-            }
             
-            // Extract price - Flipkart specific
-            const priceSelectors = [
-                '._30jeq3',
-                'div._25b18c',
-                'div[class*="_30jeq3"]',
-                'div._1_WHN1'
-            ];
-            for (const sel of priceSelectors) {
-                const priceEl = container.querySelector(sel);
-                if (priceEl) {
-                    let priceText = priceEl.textContent || priceEl.innerText || '';
-                    priceText = priceText.replace(/[^\\d]/g, '');
-                    if (priceText && priceText.length >= 4) {
-                        item.price = priceText;
-                        break;
+                // Extract price - Flipkart specific
+                const priceSelectors = [
+                    '._30jeq3',
+                    'div._25b18c',
+                    'div[class*="_30jeq3"]',
+                    'div._1_WHN1'
+                ];
+                for (const sel of priceSelectors) {
+                    const priceEl = q(container, sel);
+                    if (priceEl) {
+                        let priceText = priceEl.textContent || priceEl.innerText || '';
+                        priceText = priceText.replace(RE_NON_DIGITS, '');
+                        if (priceText && priceText.length >= 4) {
+                            item.price = priceText;
+                            break;
+                        }
                     }
                 }
-            }
             
-            // Alternative price extraction - search all text for price pattern
-            if (!item.price) {
-                const allText = container.textContent || '';
-                const priceMatch = allText.match(/₹\\s*([\\d,]+)|Rs\\.?\\s*([\\d,]+)/);
-                if (priceMatch) {
-                    item.price = (priceMatch[1] || priceMatch[2] || '').replace(/[,]/g, '');
+                // Alternative price extraction - search all text for price pattern
+                if (!item.price) {
+                    const allText = container.textContent || '';
+                    const priceMatch = RE_PRICE.exec(allText);
+                    if (priceMatch) {
+                        item.price = (priceMatch[1] || priceMatch[2] || '').replace(RE_COMMAS, '');
+                    }
                 }
-            }
             
-            // Extract rating
-            const ratingSelectors = [
-                '._3LWZlK',
-                'div[class*="_3LWZlK"]',
-                '._2_R_DZ span',
-                '[class*="rating"]'
-            ];
-            for (const sel of ratingSelectors) {
-                const ratingEl = container.querySelector(sel);
-                if (ratingEl) {
-                    let ratingText = ratingEl.textContent || ratingEl.innerText || '';
-                    const ratingMatch = ratingText.match(/([\\d.]+)/);
-                    if (ratingMatch) {
-                        item.rating = ratingMatch[1];
-                        break;
+                // Extract rating
+                const ratingSelectors = [
+                    '._3LWZlK',
+                    'div[class*="_3LWZlK"]',
+                    '._2_R_DZ span',
+                    '[class*="rating"]'
+                ];
+                for (const sel of ratingSelectors) {
+                    const ratingEl = q(container, sel);
+                    if (ratingEl) {
+                        let ratingText = ratingEl.textContent || ratingEl.innerText || '';
+                        const ratingMatch = RE_NUM.exec(ratingText);
+                        if (ratingMatch) {
+                            item.rating = ratingMatch[1];
+                            break;
+                        }
                     }
                 }
-            }
             
-            // Clean up values
-            if (item.name) {
-                item.name = item.name.trim();
-                // Remove extra whitespace and newlines
-                item.name = item.name.replace(/\\s+/g, ' ').substring(0, 150);
-            }
+                // Clean up values
+                if (item.name) {
+                    item.name = item.name.trim();
+                    // Remove extra whitespace and newlines
+                    item.name = item.name.replace(RE_SPACES, ' ').substring(0, 150);
+                }
             
-            if (item.price) {
-                item.price = item.price.replace(/[,]/g, '');
-                if (!item.price || item.price === '0' || item.price.length < 3) {
-                    item.price = null;
+                if (item.price) {
+                    item.price = item.price.replace(RE_COMMAS, '');
+                    if (!item.price || item.price === '0' || item.price.length < 3) {
+                        item.price = null;
+                    }
                 }
-            }
             
-            // Only add product if it has valid name and price
-            if (item.name && item.name.length >= 3 && item.price && item.price.length >= 3) {
-                // Set defaults for missing optional fields
-                if (!item.url) item.url = 'N/A';
-                if (!item.rating) item.rating = 'N/A';
-                products.push(item);
+                // Only add product if it has valid name and price
+                if (item.name && item.name.length >= 3 && item.price && item.price.length >= 3) {
+                    // Set defaults for missing optional fields
+                    if (!item.url) item.url = 'N/A';
+                    if (!item.rating) item.rating = 'N/A';
+                    item.price = parseInt(item.price, 10);
+                    if (passesFilters(item)) products.push(item);
+                }
+                if (products.length >= limit) break;
             }
-        });
         
-        return products;
-    })()
-    """
+            return products;
+        }
+
+        // Columnar result: four parallel arrays cross CDP instead of one object per item.
+        // Plain arrays, not typed ones: Int32Array would wrap prices above 2^31-1
+        const items = opts.site === 'zomato' ? extractRestaurants() : extractProductCards();
+        return {
+            names: items.map(item => item.name),
+            prices: items.map(item => item.price || 0),
+            ratings: items.map(item => parseFloat(item.rating) || 0),
+            urls: items.map(item => item.url)
+        };
+    };
+})();
+"""
+
+
+def _parse_price_bound(value, default: int) -> int:
+    """Price bound from a plan step; AI plans may send floats or strings like '1,00,000'"""
+    if value is None or value == "":
+        return default
+    try:
+        return int(float(str(value).translate(PRICE_TABLE)))
+    except (ValueError, OverflowError):
+        return default
+
+
+async def _handle_extract_products(page, step: dict, send_event: Callable) -> List[Dict]:
+    """Extract product/item information - supports Flipkart and Zomato"""
+    product_selector = step.get("product_selector", "")
+    fields = step.get("fields", {})
+    count = step.get("count", 3)
+    site = step.get("site", "flipkart")
+    
+    await send_event({"type": "action", "action": "extract_products", "message": f"Extracting top {count} results..."})
     
     try:
-        products = await page.evaluate(extraction_script)
+        await page.wait_for_selector("div[data-id], [class*='restaurant'], [class*='jumbo-tracker']", timeout=20000)
+    except PlaywrightTimeoutError:
+        pass
+    try:
+        await page.wait_for_load_state("domcontentloaded", timeout=5000)
+    except PlaywrightTimeoutError:
+        pass
+    
+    try:
+        min_rating = float(step["min_rating"]) if step.get("min_rating") and site == "zomato" else None
+        max_p, min_p = step.get("max_price"), step.get("min_price")
+        price_bounds = bool(max_p or min_p) and site != "zomato"
+        max_price = _parse_price_bound(max_p, 10**12)
+        min_price = _parse_price_bound(min_p, 0)
         
-        valid_products = []
-        for product in (products or []):
-            name = product.get("name", "").strip()
-            if not name or len(name) < 3:
-                continue
-            
-            price_str = str(product.get("price", "0")).replace(",", "").replace("₹", "")
-            try:
-                price_val = int(price_str) if price_str else 0
-                
-                if site == "zomato":
-                    product["price"] = str(price_val) if price_val > 0 else ""
-                    product["url"] = product.get("url", "") or ""
-                    print(product["url"])
-                    product["rating"] = product.get("rating", "") or ""
-                    valid_products.append(product)
-                else:
-                    if price_val >= 100:
-                        product["price"] = str(price_val)
-                        product["url"] = product.get("url", "") or ""
-                        product["rating"] = product.get("rating", "") or ""
-                        valid_products.append(product)
-            except:
-                if site == "zomato":
-                    product["price"] = ""
-                    product["url"] = product.get("url", "") or ""
-                    product["rating"] = product.get("rating", "") or ""
-                    valid_products.append(product)
-                continue
-        products = valid_products
+        columns = await page.evaluate(
+            "opts => window.__extractProducts(opts)",
+            {
+                "site": site,
+                "count": count,
+                "min_rating": min_rating,
+                "min_price": min_price if price_bounds else None,
+                "max_price": max_price if price_bounds else None,
+            }
+        )
         
-        filtered = products
-        if step.get("min_rating") and site == "zomato":
-            min_rating = float(step.get("min_rating"))
-            filtered = [p for p in products 
-                       if p.get("rating") and float(p.get("rating", "0")) >= min_rating]
+        # Validation and rating/price filters in one pass over the columns;
+        # dicts are only built for rows that survive
+        filtered = [
+            {"name": name, "price": price, "rating": rating, "url": url}
+            for name, price, rating, url in zip(
+                columns["names"], columns["prices"], columns["ratings"], columns["urls"]
+            )
+            if len(name) >= 3
+            and (price >= 100 or site == "zomato")
+            and (min_rating is None or rating >= min_rating)
+            and (not price_bounds or min_price <= price <= max_price)
+        ]
+        
+        if min_rating is not None:
             await send_event({"type": "action", "action": "filter_rating", 
                             "message": f"Filtered: {len(filtered)} restaurants with {min_rating}+ rating"})
-        
-        if (step.get("max_price") or step.get("min_price")) and site != "zomato":
-            max_p, min_p = step.get("max_price"), step.get("min_price")
-            filtered = [p for p in filtered 
-                       if not p.get("price") or not p["price"] or
-                       int(p["price"] or "0") <= (int(max_p) if max_p else 999999999) 
-                       and int(p["price"] or "0") >= (int(min_p) if min_p else 0)]
-            if max_p or min_p:
-                await send_event({"type": "action", "action": "filter_price", 
-                                "message": f"Filtered: {len(filtered)} items"})
+        if price_bounds:
+            await send_event({"type": "action", "action": "filter_price", 
+                            "message": f"Filtered: {len(filtered)} items"})
         
         final_products = filtered[:count] if filtered else []
         
@@ -553,9 +767,10 @@ async def _handle_extract_products(page, step: dict, send_event: Callable) -> Li
                 "action": "extract_products",
                 "message": f"✓ Extracted {len(final_products)} valid results",
                 "count": len(final_products),
-                "preview": final_products[:2] if final_products else []
+                "preview": final_products[:2] if final_products else [],
+                "urls": [p.get("url", "") for p in final_products]
             })
-        print(final_products)
+        logger.debug("Extracted products: %s", final_products)
         return final_products
     
     except Exception as e:
@@ -588,12 +803,13 @@ async def _handle_fill_form_field(page, step: dict, send_event: Callable):
 
 async def _handle_submit_form(page, step: dict, send_event: Callable):
     selectors = "button[type='submit'], input[type='submit'], button:has-text('Submit')"
-    if await _find_selector_with_retry(page, selectors):
-        await page.click(selectors.split(",")[0])
-    else:
+    try:
+        loc = await _first_matching_locator(page, selectors, timeout=10000)
+        await loc.click(timeout=5000)
+    except PlaywrightError:
         await page.keyboard.press("Enter")
     await send_event({"type": "action", "action": "submit_form", "message": "Form submitted"})
     try:
-        await page.wait_for_load_state(step.get("wait_after", "networkidle"), timeout=15000)
-    except:
+        await page.wait_for_load_state(step.get("wait_after", "domcontentloaded"), timeout=15000)
+    except PlaywrightTimeoutError:
         pass
@@ -0,0 +1,23 @@
+import httpx
+
+# One keep-alive pool for every OpenRouter call (NLU and planning). HTTP/2 lets
+# concurrent requests share a connection; the transport retries failed connects.
+client = httpx.AsyncClient(
+    timeout=10,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+    ),
+)
+
+
+async def close_http_client():
+    await client.aclose()
+
+
+async def post_completion(url: str, headers: dict, data: dict) -> str:
+    """POST a chat completion request and return the stripped message content"""
+    response = await client.post(url, headers=headers, json=data)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"].strip()
@@ -0,0 +1,41 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+
+# key -> (expires_at, value); insertion order doubles as eviction order
+_LLM_CACHE = {}
+_LLM_CACHE_LOCK = threading.Lock()
+
+
+def cache_key(*parts) -> str:
+    """Exact-match key for an LLM call, e.g. cache_key("nlu", MODEL, text, temperature)"""
+    return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def get_cached(key: str):
+    """Return a copy of the cached response, or None if missing or expired"""
+    with _LLM_CACHE_LOCK:
+        entry = _LLM_CACHE.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del _LLM_CACHE[key]
+            return None
+    return copy.deepcopy(value)
+
+
+def set_cached(key: str, value):
+    """Store a copy of a parsed LLM response, evicting the oldest entry when full"""
+    if LLM_CACHE_TTL <= 0:
+        return
+    with _LLM_CACHE_LOCK:
+        _LLM_CACHE.pop(key, None)
+        while len(_LLM_CACHE) >= LLM_CACHE_SIZE:
+            del _LLM_CACHE[next(iter(_LLM_CACHE))]
+        _LLM_CACHE[key] = (time.monotonic() + LLM_CACHE_TTL, copy.deepcopy(value))
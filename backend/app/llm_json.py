@@ -0,0 +1,33 @@
+import re
+
+import json_repair
+import orjson
+
+# Opening and closing markdown fences, stripped in a single substitution
+_FENCE_RE = re.compile(r"^```(?:json)?\n?|\n?```$", re.MULTILINE)
+
+
+def parse_llm_json(content: str):
+    """
+    Parse JSON from an LLM reply, tolerating markdown fences and small syntax slips
+    (trailing commas, unquoted keys, truncated output). Raises orjson.JSONDecodeError
+    when nothing usable can be recovered.
+    """
+    # Clean JSON from markdown code blocks if present; clean replies skip the regex
+    if content.startswith("```") or content.endswith("```"):
+        content = _FENCE_RE.sub("", content)
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        repaired = json_repair.loads(content)
+        if isinstance(repaired, (dict, list)) and repaired:
+            return repaired
+        raise
+
+
+def repair_messages(messages: list, content: str, error: Exception) -> list:
+    """Conversation for the single follow-up request asking the model to fix its JSON"""
+    return messages + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": f"Your previous reply was invalid JSON: {error}. Return only JSON."},
+    ]
@@ -18,11 +18,24 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from backend.app.nlu import parse_user_intent
 from backend.app.planner import generate_action_plan
-from backend.app.browser import run_action_plan
-import json
+from backend.app.browser import PRICE_TABLE, run_action_plan, start_browser, warm_browser, close_browser
+from backend.app.http_client import close_http_client
+import orjson
 
 app = FastAPI()
 
+# Per-connection outbound queue; the writer coalesces up to this many queued events per frame
+EVENT_QUEUE_SIZE = 256
+EVENT_BATCH_SIZE = 16
+
+MIN_NAME_LENGTH = 3
+MIN_PRODUCT_PRICE = 100
+
+# Constant status frames, serialized once instead of on every turn
+_STATUS_UNDERSTANDING = orjson.dumps({"type": "status", "message": "Understanding your request...", "status": "processing"})
+_STATUS_PLANNING = orjson.dumps({"type": "status", "message": "Planning actions...", "status": "planning"})
+_STATUS_EXECUTING = orjson.dumps({"type": "status", "message": "Executing actions...", "status": "executing"})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -30,6 +43,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+@app.on_event("startup")
+async def launch_browser():
+    # Pay the Chromium cold start here instead of on the first message (CDP or headless
+    # only, see start_browser). Failures are not fatal; the first request retries and reports the error.
+    try:
+        app.state.browser = await start_browser()
+    except Exception as e:
+        app.state.browser = None
+        print(f"Warning: Could not launch browser: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_browser():
+    app.state.browser = None
+    await close_browser()
+    await close_http_client()
+
 @app.get("/")
 def read_root():
     return {"message": "Quash Browser Agent API", "status": "running", "websocket": "/ws/chat"}
@@ -51,48 +81,106 @@ def health_check():
 #     except WebSocketDisconnect:
 #         print("Client disconnected")
 
+def _encode_event(event_data) -> bytes:
+    """Serialize an event - accepts dict, pre-serialized bytes, or string for backward compatibility"""
+    if isinstance(event_data, (bytes, bytearray)):
+        return event_data
+    if isinstance(event_data, dict):
+        return orjson.dumps(event_data)
+    # Backward compatibility: string message
+    return orjson.dumps({"type": "message", "content": event_data})
+
+
+async def _write_events(websocket: WebSocket, queue: asyncio.Queue, closed: asyncio.Event):
+    """
+    Send queued (already encoded) events, packing whatever has piled up into one
+    JSON array frame. The first failed send sets closed; after that events are only
+    acknowledged and dropped, so producers blocked on a full queue are released.
+    """
+    while True:
+        events = [await queue.get()]
+        while not queue.empty() and len(events) < EVENT_BATCH_SIZE:
+            events.append(queue.get_nowait())
+        try:
+            if closed.is_set():
+                continue
+            await websocket.send_bytes(events[0] if len(events) == 1 else b"[" + b",".join(events) + b"]")
+        except Exception as e:
+            closed.set()
+            print(f"Failed to send events, closing: {e}")
+        finally:
+            for _ in events:
+                queue.task_done()
+
+
+def _is_valid_result(r: dict) -> bool:
+    """Products need a name and a price >= 100; restaurants just need a name"""
+    if len(r.get("name", "").strip()) < MIN_NAME_LENGTH:
+        return False
+    price = r.get("price", 0)
+    # The page extractor already returns integer prices; only LLM/legacy paths send strings
+    if isinstance(price, int):
+        return price == 0 or price >= MIN_PRODUCT_PRICE
+    price_str = str(price).translate(PRICE_TABLE)
+    # For restaurants, price can be 0 or missing
+    if not price_str or price_str == "0":
+        return True
+    try:
+        return int(price_str) >= MIN_PRODUCT_PRICE
+    except ValueError:
+        return False
+
+
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+    closed = asyncio.Event()
+    writer = asyncio.create_task(_write_events(websocket, queue, closed))
 
     async def send_event(event_data):
-        """Send event to client - accepts dict or string for backward compatibility"""
-        if isinstance(event_data, dict):
-            await websocket.send_text(json.dumps(event_data))
-        else:
-            # Backward compatibility: string message
-            await websocket.send_text(json.dumps({"type": "message", "content": event_data}))
+        """
+        Encode an event and queue it for the writer task so producers never wait on the socket.
+        Serialization errors raise here, at the caller; WebSocketDisconnect is raised once
+        a send has failed, which aborts a running plan.
+        """
+        if closed.is_set():
+            raise WebSocketDisconnect()
+        frame = _encode_event(event_data)
+        try:
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            await queue.put(frame)
+
+    async def send_intent_delta(chunk):
+        await send_event({"type": "intent_delta", "chunk": chunk})
 
     try:
         while True:
             user_text = await websocket.receive_text()
             
+            # Get the browser ready while the LLM works out the intent and plan
+            browser_warmup = asyncio.create_task(warm_browser())
+            intent_task = asyncio.create_task(parse_user_intent(user_text, on_delta=send_intent_delta))
+            
             await send_event({
                 "type": "user_message",
                 "content": user_text
             })
 
             # Parse intent
-            await send_event({
-                "type": "status",
-                "message": "Understanding your request...",
-                "status": "processing"
-            })
+            await send_event(_STATUS_UNDERSTANDING)
             
-            intent_data = parse_user_intent(user_text)
+            intent_data = await intent_task
             
             await send_event({
                 "type": "intent",
                 "data": intent_data
             })
 
-            await send_event({
-                "type": "status",
-                "message": "Planning actions...",
-                "status": "planning"
-            })
+            await send_event(_STATUS_PLANNING)
             
-            plan = generate_action_plan(intent_data)
+            plan = await generate_action_plan(intent_data)
             
             await send_event({
                 "type": "plan",
@@ -101,28 +189,12 @@ async def websocket_endpoint(websocket: WebSocket):
             })
 
             # Execute plan
-            await send_event({
-                "type": "status",
-                "message": "Executing actions...",
-                "status": "executing"
-            })
+            await send_event(_STATUS_EXECUTING)
             
-            results = await run_action_plan(plan, send_event)
-
-            valid = []
-            for r in results:
-                name = r.get("name", "").strip()
-                price_str = str(r.get("price", "0")).replace(",", "").replace("₹", "")
-                if name and len(name) >= 3:
-                    try:
-                        # For restaurants, price can be 0 or missing
-                        price_val = int(price_str) if price_str else 0
-                        # Products need price >= 100, restaurants just need name
-                        if price_val >= 100 or not price_str or price_str == "0":
-                            valid.append(r)
-                    except:
-                        if not price_str or price_str == "0":
-                            valid.append(r)
+            await browser_warmup
+            results = await run_action_plan(plan, send_event, browser=app.state.browser)
+
+            valid = [r for r in results if _is_valid_result(r)]
             
             await send_event({"type": "result", "data": valid, "count": len(valid)})
             if not valid and results:
@@ -132,10 +204,14 @@ async def websocket_endpoint(websocket: WebSocket):
         print("Client disconnected")
     except Exception as e:
         try:
-            await websocket.send_text(json.dumps({
+            await send_event({
                 "type": "error",
                 "message": f"Server error: {str(e)}"
-            }))
-        except:
+            })
+        except WebSocketDisconnect:
             pass
         print(f"Error in websocket: {e}")
+    finally:
+        # The writer acks every event even when a send fails, so this cannot hang
+        await queue.join()
+        writer.cancel()
@@ -1,8 +1,14 @@
-import requests
-import json
+import httpx
+import copy
+import orjson
 import os
 from dotenv import load_dotenv
 import re
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional
+from backend.app.http_client import client as _client, post_completion
+from backend.app.llm_json import parse_llm_json, repair_messages
+from backend.app.llm_cache import cache_key, get_cached, set_cached
 
 load_dotenv()
 
@@ -10,22 +16,55 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
 MODEL = os.getenv("LLM_MODEL", "openai/gpt-3.5-turbo")
 
-def parse_user_intent(text: str) -> dict:
-    """
-    Parse user intent from natural language text.
-    Supports multiple intents: product_search, form_fill, comparison, local_discovery, navigation
-    """
-    if not OPENROUTER_API_KEY:
-        # Fallback to rule-based parsing if API key is not available
-        return _rule_based_intent_parsing(text)
-    
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # Enhanced prompt for extracting multiple intents
-    prompt = f"""Extract the intent and parameters from this user command: "{text}"
+_PRICE_RE = re.compile(r'[₹$]?\s*(\d+(?:,\d+)*)')
+_COUNT_RE = re.compile(r'(?:top|first)\s*(\d+)')
+_RATING_RE = re.compile(r'(\d+(?:\.\d+)?)\s*★|rating[:\s]+(\d+)')
+_LOC_RE = re.compile(r'near\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)')
+
+_KW_PRODUCT = frozenset({"find", "search", "show", "get", "book"})
+_KW_FORM = frozenset({"fill", "submit", "register", "signup", "form"})
+_KW_COMPARISON = frozenset({"compare", "comparison"})
+_KW_LOCAL = frozenset({"near", "places", "restaurants", "pizza", "delivery"})
+# Product name heuristic: words dropped from the name, and words that end it
+_KW_SKIP = _KW_PRODUCT | {"for", "a", "an", "the"}
+_KW_STOP = frozenset({"under", "below", "above", "near", "with", "rating"})
+
+# Intent keywords in priority order, matched as substrings like the original any(...) checks
+_INTENT_KEYWORDS = (
+    ("product_search", _KW_PRODUCT),
+    ("form_fill", _KW_FORM),
+    ("comparison", _KW_COMPARISON),
+    ("local_discovery", _KW_LOCAL),
+)
+_INTENT_PRIORITY = tuple(intent for intent, _ in _INTENT_KEYWORDS)
+# One scan tags every keyword occurrence with its intent; the lookahead keeps
+# overlapping occurrences so the result matches substring semantics exactly
+_INTENT_RE = re.compile("(?=" + "|".join(
+    f"(?P<{intent}>{'|'.join(sorted(words))})" for intent, words in _INTENT_KEYWORDS
+) + ")")
+
+# Canonical form for cache keys, so paraphrases like "Search MacBook Air below ₹1,00,000"
+# and "find MacBook Air under 100k" share one cached intent. Only command words and
+# amounts are folded; every other token (names, passwords, URLs) must match exactly.
+_CACHE_AMOUNT_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*(k|lakhs?|lacs?)\b", re.IGNORECASE)
+_CACHE_NUMBER_RE = re.compile(r"[₹$]?\d[\d,]*(?:\.\d+)?")
+_CACHE_EDGE_PUNCT = ".,!?;:\"'()"
+_CACHE_MULTIPLIERS = {"k": 1000, "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000}
+_CACHE_SYNONYMS = {
+    "search": "find", "show": "find", "get": "find", "look": "find",
+    "below": "under", "less": "under", "within": "under", "upto": "under",
+    "over": "above", "more": "above",
+}
+_CACHE_STOPWORDS = frozenset({
+    "a", "an", "the", "me", "for", "please", "than", "to", "up", "of", "rs", "inr", "rupees",
+})
+_CACHE_KEYWORDS = (
+    _KW_PRODUCT | _KW_COMPARISON | _KW_LOCAL | _KW_STOP
+    | set(_CACHE_SYNONYMS.values()) | {"top", "first", "max", "min"}
+)
+
+# Static so the provider can cache it as a shared prefix; the user text goes in its own message
+_NLU_SYSTEM_PROMPT = """Extract the intent and parameters from the user command.
 
 Return a JSON object with these fields:
 - "intent": one of [product_search, form_fill, comparison, local_discovery, navigation, unknown]
@@ -42,46 +81,74 @@ Return a JSON object with these fields:
 - "form_data" (object, for form_fill): field_name -> value mappings
 - "url" (optional): URL to navigate to
 - "comparison_fields" (array, for comparison): fields to compare (e.g., ["price", "rating"])
+- "needs_ai" (optional): true if the command does not fit these fields well and needs custom planning
 
 Examples:
-- "Find MacBook Air under ₹100000" → {{"intent": "product_search", "product_name": "MacBook Air", "filters": {{"max_price": 100000}}}}
-- "Fill signup form with temp email" → {{"intent": "form_fill", "form_data": {{"email": "generate_temp"}}}}
-- "Top 3 pizza places near Indiranagar with 4+ rating" → {{"intent": "local_discovery", "category": "pizza", "location": "Indiranagar", "filters": {{"rating_min": 4, "count": 3}}}}
+- "Find MacBook Air under ₹100000" → {"intent": "product_search", "product_name": "MacBook Air", "filters": {"max_price": 100000}}
+- "Fill signup form with temp email" → {"intent": "form_fill", "form_data": {"email": "generate_temp"}}
+- "Top 3 pizza places near Indiranagar with 4+ rating" → {"intent": "local_discovery", "category": "pizza", "location": "Indiranagar", "filters": {"rating_min": 4, "count": 3}}
 
 Return ONLY valid JSON, no markdown or extra text."""
 
+async def parse_user_intent(text: str, on_delta: Optional[Callable[[str], Awaitable]] = None) -> dict:
+    """
+    Parse user intent from natural language text.
+    Supports multiple intents: product_search, form_fill, comparison, local_discovery, navigation
+    If on_delta is given, the LLM response is streamed and each text chunk is passed to it.
+    """
+    if not OPENROUTER_API_KEY:
+        # Fallback to rule-based parsing if API key is not available
+        return _rule_based_intent_parsing(text)
+    
+    key = cache_key("nlu", MODEL, _normalize_for_cache(text), 0.1)
+    cached = get_cached(key)
+    if cached is not None:
+        return cached
+    
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    
     data = {
         "model": MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 300,
+        "messages": [
+            {"role": "system", "content": _NLU_SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ],
+        "max_tokens": 150,
         "temperature": 0.1
     }
 
+    content = ""
     try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        response_json = response.json()
-        content = response_json["choices"][0]["message"]["content"].strip()
-        
-        # Clean JSON from markdown code blocks if present
-        if content.startswith("```"):
-            content = re.sub(r"^```(?:json)?\n?", "", content)
-            content = re.sub(r"\n?```$", "", content)
+        if on_delta:
+            content = await _stream_completion(headers, data, on_delta)
+        else:
+            content = await post_completion(OPENROUTER_API_URL, headers, data)
         
-        intent_data = json.loads(content)
+        try:
+            intent_data = parse_llm_json(content)
+        except orjson.JSONDecodeError as e:
+            # One repair round-trip before falling back to the rule-based parser
+            content = await post_completion(
+                OPENROUTER_API_URL, headers, {**data, "messages": repair_messages(data["messages"], content, e)}
+            )
+            intent_data = parse_llm_json(content)
         
         # Validate and set defaults
         if "intent" not in intent_data:
             intent_data["intent"] = "unknown"
         if "filters" not in intent_data:
             intent_data["filters"] = {}
-            
+        
+        set_cached(key, intent_data)
         return intent_data
     
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         print(f"JSON decode error: {e}, content: {content[:200]}")
         return _rule_based_intent_parsing(text)
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"API request error: {e}")
         return _rule_based_intent_parsing(text)
     except Exception as e:
@@ -89,13 +156,72 @@ Return ONLY valid JSON, no markdown or extra text."""
         return _rule_based_intent_parsing(text)
 
 
+async def _stream_completion(headers: dict, data: dict, on_delta: Callable[[str], Awaitable]) -> str:
+    """POST with stream=True, forward each SSE content delta and return the full text"""
+    parts = []
+    async with _client.stream("POST", OPENROUTER_API_URL, headers=headers, json={**data, "stream": True}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank lines
+            if not line.startswith("data: "):
+                continue
+            payload = line[len("data: "):]
+            if payload == "[DONE]":
+                break
+            try:
+                choices = orjson.loads(payload).get("choices") or [{}]
+            except orjson.JSONDecodeError:
+                # One garbled chunk should not cost the whole response
+                print(f"Skipping malformed stream chunk: {payload[:200]}")
+                continue
+            chunk = choices[0].get("delta", {}).get("content")
+            if chunk:
+                parts.append(chunk)
+                await on_delta(chunk)
+    return "".join(parts).strip()
+
+
+def _normalize_for_cache(text: str) -> str:
+    """
+    Case/punctuation-insensitive on command words, filler dropped, synonyms unified,
+    amounts like ₹1,00,000 / 100k / 1 lakh expanded. Any other token is kept exactly
+    as written, and form commands are keyed on the raw text, so values typed into
+    the page (names, passwords, product names) never share a key.
+    """
+    text = text.strip()
+    lowered = text.lower()
+    if any(word in lowered for word in _KW_FORM):
+        return text
+    text = _CACHE_AMOUNT_RE.sub(
+        lambda m: str(int(float(m.group(1)) * _CACHE_MULTIPLIERS[m.group(2).lower()])), text
+    )
+    tokens = []
+    for token in text.split():
+        word = token.lower().strip(_CACHE_EDGE_PUNCT)
+        word = _CACHE_SYNONYMS.get(word, word)
+        if word in _CACHE_STOPWORDS:
+            continue
+        if word in _CACHE_KEYWORDS:
+            tokens.append(word)
+        elif _CACHE_NUMBER_RE.fullmatch(token):
+            tokens.append(token.lstrip("₹$").replace(",", ""))
+        else:
+            tokens.append(token)
+    return " ".join(tokens) if tokens else text
+
+
 def _rule_based_intent_parsing(text: str) -> dict:
-    """Fallback rule-based intent parsing"""
+    """Fallback rule-based intent parsing; callers get their own copy of the memoized result"""
+    return copy.deepcopy(_parse_rules(text))
+
+
+@lru_cache(maxsize=4096)
+def _parse_rules(text: str) -> dict:
     text_lower = text.lower()
     intent_data = {"intent": "unknown", "filters": {}}
     
     # Extract price filters
-    price_match = re.search(r'[₹$]?\s*(\d+(?:,\d+)*)', text)
+    price_match = _PRICE_RE.search(text)
     if price_match:
         price = int(price_match.group(1).replace(",", ""))
         if "under" in text_lower or "below" in text_lower or "max" in text_lower:
@@ -104,44 +230,43 @@ def _rule_based_intent_parsing(text: str) -> dict:
             intent_data["filters"]["min_price"] = price
     
     # Extract count (top N)
-    count_match = re.search(r'(?:top|first)\s*(\d+)', text_lower)
+    count_match = _COUNT_RE.search(text_lower)
     if count_match:
         intent_data["filters"]["count"] = int(count_match.group(1))
     
     # Extract rating
-    rating_match = re.search(r'(\d+(?:\.\d+)?)\s*★|rating[:\s]+(\d+)', text_lower)
+    rating_match = _RATING_RE.search(text_lower)
     if rating_match:
         rating = float(rating_match.group(1) or rating_match.group(2))
         intent_data["filters"]["rating_min"] = rating
     
     # Detect intent type
-    if any(word in text_lower for word in ["find", "search", "show", "get", "book"]):
+    matched = {m.lastgroup for m in _INTENT_RE.finditer(text_lower)}
+    intent = next((i for i in _INTENT_PRIORITY if i in matched), None)
+    
+    if intent == "product_search":
         intent_data["intent"] = "product_search"
         # Extract product name (simple heuristic)
-        words = text.split()
         product_words = []
-        skip_next = False
-        for i, word in enumerate(words):
-            if skip_next:
-                skip_next = False
-                continue
-            if word.lower() in ["find", "search", "show", "get", "book", "for", "a", "an", "the"]:
+        for word in text.split():
+            word_lower = word.lower()
+            if word_lower in _KW_SKIP:
                 continue
-            if word.lower() in ["under", "below", "above", "near", "with", "rating"]:
+            if word_lower in _KW_STOP:
                 break
             product_words.append(word)
         intent_data["product_name"] = " ".join(product_words[:5])  # Limit to 5 words
     
-    elif any(word in text_lower for word in ["fill", "submit", "register", "signup", "form"]):
+    elif intent == "form_fill":
         intent_data["intent"] = "form_fill"
         intent_data["form_data"] = {}
     
-    elif any(word in text_lower for word in ["compare", "comparison"]):
+    elif intent == "comparison":
         intent_data["intent"] = "comparison"
     
-    elif any(word in text_lower for word in ["near", "places", "restaurants", "pizza", "delivery"]):
+    elif intent == "local_discovery":
         intent_data["intent"] = "local_discovery"
-        location_match = re.search(r'near\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', text)
+        location_match = _LOC_RE.search(text)
         if location_match:
             intent_data["location"] = location_match.group(1)
     
@@ -1,7 +1,12 @@
-import requests
-import json
+import orjson
 import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Tuple
 from dotenv import load_dotenv
+from backend.app.http_client import post_completion
+from backend.app.llm_json import parse_llm_json, repair_messages
+from backend.app.llm_cache import cache_key, get_cached, set_cached
 
 load_dotenv()
 
@@ -9,143 +14,158 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
 MODEL = os.getenv("LLM_MODEL", "openai/gpt-3.5-turbo")
 
+
+@dataclass(frozen=True)
+class SiteCfg:
+    """Selectors for one site; card/title cover product cards and restaurant cards alike"""
+    url: str
+    search_input: str
+    search_button: str
+    card_selector: str
+    title_selector: str
+    price_selector: str
+    rating_selector: str
+    link_selector: str
+
+
 # Site-specific selectors and configurations
-SITE_CONFIGS = {
-    "flipkart": {
-        "url": "https://www.flipkart.com",
-        "search_input": "input[title*='Search'], input[name='q'], input[placeholder*='Search'], input[type='text']",
-        "search_button": "button[type='submit'], svg + button, button._2iLD__",
-        "product_card": "[data-id], div[data-id], ._1AtVbE, div._2kHMtA, div[class*='_13oc-S'], div[class*='tUxRFH']",
-        "price_selector": "._30jeq3, ._25b18c, div[class*='_30jeq3'], div._1_WHN1",
-        "title_selector": "a._2UzuFa, a.s1Q9rs, a[title], ._4rR01T, a._1fQZEK",
-        "rating_selector": "._3LWZlK, div[class*='_3LWZlK'], ._2_R_DZ span",
-        "link_selector": "a._2UzuFa, a.s1Q9rs, a._1fQZEK, a",
-    },
-    "amazon": {
-        "url": "https://www.amazon.in",
-        "search_input": "#twotabsearchtextbox, input[name='field-keywords']",
-        "search_button": "#nav-search-submit-button, input[type='submit'][value='Go']",
-        "product_card": "[data-index], .s-result-item",
-        "price_selector": ".a-price-whole, .a-price .a-offscreen",
-        "title_selector": "h2 a span, .a-text-normal",
-        "rating_selector": ".a-icon-alt, .a-icon-star-small",
-        "link_selector": "h2 a",
-    },
-    "zomato": {
-        "url": "https://www.zomato.com",
-        "search_input": "input[placeholder*='Search'], input[name='q'], input[type='text']",
-        "search_button": "button[type='submit'], .sc-fzqARJ, button",
-        "restaurant_card": "[data-testid*='restaurant'], [class*='jumbo-tracker'], [class*='sc-1mo3ldo'], [class*='restaurant-card']",
-        "name_selector": "h4, a[href*='/r/'], [class*='restaurant-name']",
-        "rating_selector": "[class*='rating'], [class*='sc-1q7bklc'], .rating",
-        "price_selector": "[class*='cost'], [class*='sc-1hez2tp'], [class*='price-range']",
-        "link_selector": "a[href*='/r/'], a",
-    }
-}
+SITE_CONFIGS: Mapping[str, SiteCfg] = MappingProxyType({
+    "flipkart": SiteCfg(
+        url="https://www.flipkart.com",
+        search_input="input[title*='Search'], input[name='q'], input[placeholder*='Search'], input[type='text']",
+        search_button="button[type='submit'], svg + button, button._2iLD__",
+        card_selector="[data-id], div[data-id], ._1AtVbE, div._2kHMtA, div[class*='_13oc-S'], div[class*='tUxRFH']",
+        price_selector="._30jeq3, ._25b18c, div[class*='_30jeq3'], div._1_WHN1",
+        title_selector="a._2UzuFa, a.s1Q9rs, a[title], ._4rR01T, a._1fQZEK",
+        rating_selector="._3LWZlK, div[class*='_3LWZlK'], ._2_R_DZ span",
+        link_selector="a._2UzuFa, a.s1Q9rs, a._1fQZEK, a",
+    ),
+    "amazon": SiteCfg(
+        url="https://www.amazon.in",
+        search_input="#twotabsearchtextbox, input[name='field-keywords']",
+        search_button="#nav-search-submit-button, input[type='submit'][value='Go']",
+        card_selector="[data-index], .s-result-item",
+        price_selector=".a-price-whole, .a-price .a-offscreen",
+        title_selector="h2 a span, .a-text-normal",
+        rating_selector=".a-icon-alt, .a-icon-star-small",
+        link_selector="h2 a",
+    ),
+    "zomato": SiteCfg(
+        url="https://www.zomato.com",
+        search_input="input[placeholder*='Search'], input[name='q'], input[type='text']",
+        search_button="button[type='submit'], .sc-fzqARJ, button",
+        card_selector="[data-testid*='restaurant'], [class*='jumbo-tracker'], [class*='sc-1mo3ldo'], [class*='restaurant-card']",
+        title_selector="h4, a[href*='/r/'], [class*='restaurant-name']",
+        rating_selector="[class*='rating'], [class*='sc-1q7bklc'], .rating",
+        price_selector="[class*='cost'], [class*='sc-1hez2tp'], [class*='price-range']",
+        link_selector="a[href*='/r/'], a",
+    ),
+})
+
+
+def _search_template(cfg: SiteCfg, clear_first: bool) -> Tuple[dict, ...]:
+    """navigate -> type -> click -> extract, with the query and count left to fill in"""
+    steps = [{
+        "action": "navigate",
+        "url": cfg.url,
+        "wait_until": "domcontentloaded",
+        "ready_selector": cfg.search_input
+    }]
+    if clear_first:
+        steps.append({
+            "action": "wait_for",
+            "selector": cfg.search_input,
+            "timeout": 10000
+        })
+    steps.append({
+        "action": "type",
+        "selector": cfg.search_input,
+        "value": None,
+        **({"clear_first": True} if clear_first else {})
+    })
+    steps.append({
+        "action": "click",
+        "selector": cfg.search_button,
+        "wait_after": "domcontentloaded"
+    })
+    # The nested fields dict is shared between plans; steps are only read downstream
+    steps.append({
+        "action": "extract_products",
+        "product_selector": cfg.card_selector,
+        "fields": {
+            "name": cfg.title_selector,
+            "price": cfg.price_selector,
+            "rating": cfg.rating_selector,
+            "url": cfg.link_selector
+        },
+        "count": None,
+        "site": None
+    })
+    return tuple(steps)
 
 
-def generate_action_plan(intent_data: dict) -> list:
+# Selectors never change at runtime, so each site's steps are built once and copied per plan
+_PRODUCT_SEARCH_TEMPLATES: Mapping[str, Tuple[dict, ...]] = MappingProxyType({
+    site: _search_template(cfg, clear_first=True) for site, cfg in SITE_CONFIGS.items()
+})
+_LOCAL_DISCOVERY_TEMPLATE = _search_template(SITE_CONFIGS["zomato"], clear_first=False)
+
+# Intents the templates below cannot cover well; everything else skips the LLM round-trip
+_LLM_REQUIRED = frozenset({"comparison", "unknown"})
+
+
+async def generate_action_plan(intent_data: dict) -> list:
     """Generate browser action plan from intent"""
     intent = intent_data.get("intent", "unknown")
     site = intent_data.get("site", "flipkart").lower()
-    filters = intent_data.get("filters", {})
-    count = filters.get("count", 3)
     
-    if OPENROUTER_API_KEY and (plan := _ai_plan(intent_data)):
+    if OPENROUTER_API_KEY and _needs_ai_plan(intent_data, intent, site) and (plan := await _ai_plan(intent_data)):
         return plan
     
+    return _template_plan(intent_data)
+
+
+def _template_plan(intent_data: dict) -> list:
+    """Deterministic plan built from the site templates"""
+    intent = intent_data.get("intent", "unknown")
+    site = intent_data.get("site", "flipkart").lower()
+    filters = intent_data.get("filters", {})
+    count = filters.get("count", 3)
+    
     plan = []
     
     if intent == "product_search":
-        site_config = SITE_CONFIGS.get(site, SITE_CONFIGS["flipkart"])
         query = intent_data.get("query") or intent_data.get("product_name", "")
         
-        plan.append({
-            "action": "navigate",
-            "url": site_config["url"],
-            "wait_until": "networkidle"
-        })
-        plan.append({
-            "action": "wait_for",
-            "selector": site_config["search_input"],
-            "timeout": 10000
-        })
-        plan.append({
-            "action": "type",
-            "selector": site_config["search_input"],
-            "value": query,
-            "clear_first": True
-        })
-        plan.append({
-            "action": "click",
-            "selector": site_config["search_button"],
-            "wait_after": "networkidle"
-        })
+        plan = [dict(step) for step in _PRODUCT_SEARCH_TEMPLATES.get(site, _PRODUCT_SEARCH_TEMPLATES["flipkart"])]
+        plan[2]["value"] = query
+        plan[-1]["count"] = count
+        plan[-1]["site"] = site
         
         # Apply price filter if specified
         if "max_price" in filters:
-            plan.append({
+            plan.insert(-1, {
                 "action": "filter_price",
                 "max_price": filters["max_price"],
                 "min_price": filters.get("min_price")
             })
         
-        # Extract results
-        plan.append({
-            "action": "extract_products",
-            "product_selector": site_config["product_card"],
-            "fields": {
-                "name": site_config["title_selector"],
-                "price": site_config["price_selector"],
-                "rating": site_config["rating_selector"],
-                "url": site_config["link_selector"]
-            },
-            "count": count,
-            "site": site
-        })
-        
     elif intent == "local_discovery":
         location = intent_data.get("location", "")
         category = intent_data.get("category", "restaurants")
-        site_config = SITE_CONFIGS.get("zomato", SITE_CONFIGS["flipkart"])
         
-        query = f"{category} near {location}"
-        plan.append({
-            "action": "navigate",
-            "url": site_config["url"],
-            "wait_until": "networkidle"
-        })
-        plan.append({
-            "action": "type",
-            "selector": site_config["search_input"],
-            "value": query
-        })
-        plan.append({
-            "action": "click",
-            "selector": site_config["search_button"],
-            "wait_after": "networkidle"
-        })
+        plan = [dict(step) for step in _LOCAL_DISCOVERY_TEMPLATE]
+        plan[1]["value"] = f"{category} near {location}"
+        plan[-1]["count"] = count
+        plan[-1]["site"] = "zomato"
+        plan[-1]["min_rating"] = filters.get("rating_min")  # Pass rating filter to extraction
         
         if "rating_min" in filters:
-            plan.append({
+            plan.insert(-1, {
                 "action": "filter_rating",
                 "min_rating": filters["rating_min"]
             })
         
-        plan.append({
-            "action": "extract_products",
-            "product_selector": site_config.get("restaurant_card", site_config.get("product_card", "")),
-            "fields": {
-                "name": site_config.get("name_selector", site_config.get("title_selector", "")),
-                "rating": site_config["rating_selector"],
-                "price": site_config.get("price_selector", ""),
-                "url": site_config["link_selector"]
-            },
-            "count": count,
-            "site": "zomato",
-            "min_rating": filters.get("rating_min")  # Pass rating filter to extraction
-        })
-        
     elif intent == "form_fill":
         url = intent_data.get("url", "")
         form_data = intent_data.get("form_data", {})
@@ -154,7 +174,7 @@ def generate_action_plan(intent_data: dict) -> list:
             plan.append({
                 "action": "navigate",
                 "url": url,
-                "wait_until": "networkidle"
+                "wait_until": "domcontentloaded"
             })
         
         # Fill form fields
@@ -168,7 +188,7 @@ def generate_action_plan(intent_data: dict) -> list:
         
         plan.append({
             "action": "submit_form",
-            "wait_after": "networkidle"
+            "wait_after": "domcontentloaded"
         })
         
     elif intent == "comparison":
@@ -180,25 +200,25 @@ def generate_action_plan(intent_data: dict) -> list:
             site_config = SITE_CONFIGS.get(site, SITE_CONFIGS["flipkart"])
             plan.append({
                 "action": "navigate",
-                "url": site_config["url"]
+                "url": site_config.url
             })
         plan.append({
             "action": "type",
-                "selector": site_config["search_input"],
+                "selector": site_config.search_input,
             "value": product_name
         })
         plan.append({
             "action": "click",
-                "selector": site_config["search_button"]
+                "selector": site_config.search_button
         })
         plan.append({
                 "action": "extract_products",
-                "product_selector": site_config["product_card"],
+                "product_selector": site_config.card_selector,
                 "fields": {
-                    "name": site_config["title_selector"],
-                    "price": site_config["price_selector"],
-                    "rating": site_config["rating_selector"],
-                    "url": site_config["link_selector"]
+                    "name": site_config.title_selector,
+                    "price": site_config.price_selector,
+                    "rating": site_config.rating_selector,
+                    "url": site_config.link_selector
                 },
                 "count": 1,
                 "site": site
@@ -210,7 +230,7 @@ def generate_action_plan(intent_data: dict) -> list:
             plan.append({
                 "action": "navigate",
                 "url": url,
-                "wait_until": "networkidle"
+                "wait_until": "domcontentloaded"
             })
     
     else:
@@ -222,14 +242,8 @@ def generate_action_plan(intent_data: dict) -> list:
     return plan
 
 
-def _ai_plan(intent_data: dict) -> list:
-    """AI-powered planning using LLM"""
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    prompt = f"""Given this intent data: {json.dumps(intent_data, indent=2)}
+# Static so the provider can cache it as a shared prefix; the intent goes in the user message
+_PLAN_SYSTEM_PROMPT = """You are given intent data as JSON.
 For local discovery intents, ALWAYS generate a plan that navigates and interacts with the Zomato website (https://www.zomato.com), never Google Maps or other sites.
 For product search intents, use Flipkart or Amazon as specified.
 Generate a step-by-step action plan as a JSON array. Each action is an object with:
@@ -237,37 +251,59 @@ Generate a step-by-step action plan as a JSON array. Each action is an object wi
 - Other fields specific to each action
 
 Available actions:
-1. navigate: {{"action": "navigate", "url": "...", "wait_until": "networkidle"}}
-2. type: {{"action": "type", "selector": "...", "value": "...", "clear_first": true}}
-3. click: {{"action": "click", "selector": "...", "wait_after": "networkidle"}}
-4. wait_for: {{"action": "wait_for", "selector": "...", "timeout": 10000}}
-5. extract_products: {{"action": "extract_products", "product_selector": "...", "fields": {{"name": "...", "price": "...", "rating": "...", "url": "..."}}, "count": 3, "site": "flipkart"}}
-6. filter_price: {{"action": "filter_price", "max_price": 100000}}
-7. fill_form_field: {{"action": "fill_form_field", "field_name": "email", "value": "..."}}
-8. submit_form: {{"action": "submit_form"}}
+1. navigate: {"action": "navigate", "url": "...", "wait_until": "domcontentloaded", "ready_selector": "..."}
+2. type: {"action": "type", "selector": "...", "value": "...", "clear_first": true, "keystroke": false, "submit": false}
+3. click: {"action": "click", "selector": "...", "wait_after": "domcontentloaded"}
+4. wait_for: {"action": "wait_for", "selector": "...", "timeout": 10000}
+5. extract_products: {"action": "extract_products", "product_selector": "...", "fields": {"name": "...", "price": "...", "rating": "...", "url": "..."}, "count": 3, "site": "flipkart"}
+6. filter_price: {"action": "filter_price", "max_price": 100000}
+7. fill_form_field: {"action": "fill_form_field", "field_name": "email", "value": "..."}
+8. submit_form: {"action": "submit_form"}
 
 Return ONLY a JSON array of actions, no markdown."""
 
+
+def _needs_ai_plan(intent_data: dict, intent: str, site: str) -> bool:
+    """True unless a template handles this intent (and, for product search, this site)"""
+    if intent in _LLM_REQUIRED or intent_data.get("needs_ai"):
+        return True
+    return intent == "product_search" and site not in SITE_CONFIGS
+
+
+async def _ai_plan(intent_data: dict) -> list:
+    """AI-powered planning using LLM"""
+    key = cache_key("plan", MODEL, orjson.dumps(intent_data, option=orjson.OPT_SORT_KEYS).decode(), 0.1)
+    cached = get_cached(key)
+    if cached is not None:
+        return cached
+    
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    
     data = {
         "model": MODEL,
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": [
+            {"role": "system", "content": _PLAN_SYSTEM_PROMPT},
+            {"role": "user", "content": orjson.dumps(intent_data).decode()}
+        ],
         "max_tokens": 800,
         "temperature": 0.1
     }
     
     try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"].strip()
-        
-        # Clean JSON
-        if content.startswith("```"):
-            import re
-            content = re.sub(r"^```(?:json)?\n?", "", content)
-            content = re.sub(r"\n?```$", "", content)
-        
-        plan = json.loads(content)
+        content = await post_completion(OPENROUTER_API_URL, headers, data)
+        try:
+            plan = parse_llm_json(content)
+        except orjson.JSONDecodeError as e:
+            # A single repair round-trip bounds the added latency
+            content = await post_completion(
+                OPENROUTER_API_URL, headers, {**data, "messages": repair_messages(data["messages"], content, e)}
+            )
+            plan = parse_llm_json(content)
         if isinstance(plan, list):
+            set_cached(key, plan)
             return plan
     except Exception as e:
         print(f"AI planning failed: {e}")
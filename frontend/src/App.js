@@ -1,6 +1,8 @@
 import React, { useState, useEffect, useRef } from 'react';
 import './App.css';
 
+const textDecoder = new TextDecoder();
+
 function App() {
   const [messages, setMessages] = useState([]);
   const [inputValue, setInputValue] = useState('');
@@ -33,6 +35,7 @@ function App() {
     const wsUrl = `${protocol}//${backendHost}/ws/chat`;
     
     const ws = new WebSocket(wsUrl);
+    ws.binaryType = 'arraybuffer';
     
     ws.onopen = () => {
       setIsConnected(true);
@@ -41,8 +44,15 @@ function App() {
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
-        handleWebSocketMessage(data);
+        // Pre-serialized events arrive as binary frames
+        const text = typeof event.data === 'string' ? event.data : textDecoder.decode(event.data);
+        const data = JSON.parse(text);
+        // Events queued together on the server arrive as one JSON array
+        if (Array.isArray(data)) {
+          data.forEach(handleWebSocketMessage);
+        } else {
+          handleWebSocketMessage(data);
+        }
       } catch (e) {
         console.error('Error parsing message:', e);
       }
@@ -75,7 +85,12 @@ function App() {
         addMessage('agent', data.message, 'status');
         break;
 
+      case 'intent_delta':
+        appendStreamingText(data.chunk);
+        break;
+
       case 'intent':
+        finishStreamingText();
         addMessage('agent', `Intent detected: ${data.data.intent}`, 'info');
         break;
 
@@ -131,6 +146,29 @@ function App() {
     setMessages(prev => [...prev, message]);
   };
 
+  // Streamed LLM output grows a single bubble until the final event arrives
+  const appendStreamingText = (chunk) => {
+    setMessages(prev => {
+      const last = prev[prev.length - 1];
+      if (last && last.streaming) {
+        return [...prev.slice(0, -1), { ...last, text: last.text + chunk }];
+      }
+      return [...prev, {
+        id: Date.now() + Math.random(),
+        sender: 'agent',
+        text: chunk,
+        variant: 'info',
+        timestamp: new Date(),
+        data: null,
+        streaming: true
+      }];
+    });
+  };
+
+  const finishStreamingText = () => {
+    setMessages(prev => prev.map(msg => (msg.streaming ? { ...msg, streaming: false } : msg)));
+  };
+
   const updateLastActionMessage = (action, status) => {
     setMessages(prev => {
       const newMessages = [...prev];
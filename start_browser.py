@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import sys
+import os
+import platform
+import asyncio
+
+if platform.system() == 'Windows':
+    if sys.version_info >= (3, 8):
+        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+    else:
+        print("✗ ERROR: Python 3.8+ required on Windows")
+        sys.exit(1)
+
+from playwright.async_api import async_playwright
+
+PORT = int(os.getenv("BROWSER_CDP_PORT", "9222"))
+
+
+async def main():
+    headless = os.getenv("BROWSER_HEADLESS", "true").lower() == "true"
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            headless=headless,
+            args=[
+                f"--remote-debugging-port={PORT}",
+                "--remote-debugging-address=127.0.0.1",
+                "--disable-blink-features=AutomationControlled",
+            ]
+        )
+        print(f"Chromium {browser.version} listening for CDP clients")
+        print(f"Set BROWSER_CDP_URL=http://127.0.0.1:{PORT} for the backend")
+        print("\nPress CTRL+C to stop\n")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await browser.close()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Starting shared Chromium for Quash Browser Agent...")
+    print("=" * 60)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n\nBrowser stopped by user")
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import platform
 
@@ -14,6 +15,11 @@ if platform.system() == 'Windows':
 
 import uvicorn
 
+# uvloop has no Windows build, and Playwright there needs the Proactor loop set above
+LOOP = "asyncio" if platform.system() == 'Windows' else "uvloop"
+# Windows stays single-process; uvicorn's multiprocess supervisor there does not keep the Proactor policy
+WORKERS = 1 if platform.system() == 'Windows' else int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
 if __name__ == "__main__":
     print("=" * 60)
     print("Starting Quash Browser Agent Backend...")
@@ -24,6 +30,7 @@ if __name__ == "__main__":
         policy = asyncio.get_event_loop_policy()
         print(f"Event Loop Policy: {type(policy).__name__}")
         print("✓ Windows subprocess support enabled")
+    print(f"Event loop: {LOOP}, workers: {WORKERS}")
     print("=" * 60)
     print("\nServer starting at http://localhost:8000")
     print("WebSocket endpoint: ws://localhost:8000/ws/chat")
@@ -35,6 +42,10 @@ if __name__ == "__main__":
             host="0.0.0.0",
             port=8000,
             reload=False,
+            workers=WORKERS,
+            loop=LOOP,
+            http="httptools",
+            ws="websockets",
             log_level="info"
         )
     except KeyboardInterrupt: